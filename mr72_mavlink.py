@@ -1,223 +1,505 @@
+import argparse
+import array
+import logging
+import os
+import queue
+import select
+import threading
 import serial, time
 from pymavlink import mavutil
-from filterpy.kalman import KalmanFilter
 import numpy as np
 
-# Serial & MAVLink settings...
-MR72_PORT, MR72_BAUD = '/dev/ttyS0', 115200
-FC_PORT, FC_BAUD = '/dev/serial/by-id/usb-ArduPilot_Pixhawk6X_36004E001351333031333637-if00', 115200
+# Numba is optional: with it the Kalman step is JIT-compiled, without it
+# smooth() falls back to plain numpy ops
+try:
+    from numba import njit  # type: ignore
+    NumbaAvailable = True
+except ImportError:
+    NumbaAvailable = False
+
+# Serial & MAVLink settings (environment overrides, then CLI flags, win)...
+MR72_PORT = os.environ.get('MR72_PORT', '/dev/ttyS0')
+MR72_BAUD = int(os.environ.get('MR72_BAUD', 115200))
+FC_PORT = os.environ.get('MR72_FC_PORT', '/dev/serial/by-id/usb-ArduPilot_Pixhawk6X_36004E001351333031333637-if00')
+FC_BAUD = int(os.environ.get('MR72_FC_BAUD', 115200))
+FRAME_HEADER, FRAME_LEN = b'TH', 19
+FRAME_HEADER_U16 = 0x5448  # b'TH' as a big-endian int for a cheap sync check
 FAKE_DISTANCE = 3000
 MIN_DISTANCE, MAX_DISTANCE = 30, 3000
 SECTOR_ORIENTATION = {2:0,1:1,8:2,7:3,6:4,5:5,4:6,3:7}
+# (list index, frame field) for each sector the MR72 reports; distances are
+# passed around as flat 8-element sequences where index i holds sector i+1
+SECTOR_FIELDS = ((0, 7), (1, 0), (2, 1))
+REPORTED_SECTORS, REPORTED_FIELDS = (np.array(c) for c in zip(*SECTOR_FIELDS))
+# (sector id, MAV_SENSOR_ORIENTATION) pairs resolved once instead of per send
+SECTOR_SLOTS = tuple((sid, SECTOR_ORIENTATION[sid]) for sid in range(1, 9))
+OBSTACLE_SLOTS = 72  # fixed length of OBSTACLE_DISTANCE.distances
+OBSTACLE_INCREMENT = 45  # degrees per slot, so slot n matches orientation n (yaw 45*n)
+UINT16_MAX = 65535  # OBSTACLE_DISTANCE "unused slot" marker
 SEND_INTERVAL = 0.1  # 10 Hz
 RECONNECT_DELAY = 2.0  # seconds to wait before reconnecting
+HEARTBEAT_INTERVAL = 1.0  # seconds between our own heartbeats
 HEARTBEAT_TIMEOUT = 5.0  # seconds without FC heartbeat before reconnect
+READ_CHUNK = 256  # max bytes pulled from the UART per read
+RX_BUF_SIZE = 4096  # preallocated receive buffer, compacted in place
+READ_TIMEOUT = 0.1  # max wait for UART data; shortened to hit the next heartbeat
+
+DATA_TIMEOUT = 5.0  # seconds without MR72 bytes before warning
+
+# Integer nanosecond copies of the timings for the monotonic_ns() scheduler
+NS_PER_S = 1_000_000_000
+SEND_INTERVAL_NS = int(SEND_INTERVAL * NS_PER_S)
+HEARTBEAT_INTERVAL_NS = int(HEARTBEAT_INTERVAL * NS_PER_S)
+HEARTBEAT_TIMEOUT_NS = int(HEARTBEAT_TIMEOUT * NS_PER_S)
+READ_TIMEOUT_NS = int(READ_TIMEOUT * NS_PER_S)
+DATA_TIMEOUT_NS = int(DATA_TIMEOUT * NS_PER_S)
+
+RT_PRIORITY = 20  # SCHED_FIFO priority for the bridge (needs root/CAP_SYS_NICE)
+FALLBACK_NICE = -10  # used when real-time scheduling is not permitted
+
+INVALID_LOG_EVERY = 100  # log one warning per this many rejected frames
+FRAME_QUEUE_SIZE = 8  # frames held for the FC side (~0.5 s); the oldest is dropped beyond this
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())  # the application configures handlers
+
+# 📈 Kalman state for all 8 sectors as flat arrays (1-D model, F = H = 1)
+KF_R = 100.0   # measurement noise
+KF_Q = 0.1     # process noise
+kf_x = np.full(8, float(FAKE_DISTANCE))
+kf_P = np.full(8, 1000.0)
+kf_K = np.empty(8)    # scratch: gain
+kf_y = np.empty(8)    # scratch: innovation
+# Latest decoded frame; parse_packet() overwrites it instead of allocating.
+# Unreported sectors are never written, so they stay at FAKE_DISTANCE
+raw_cm = np.full(8, float(FAKE_DISTANCE))
+
+if NumbaAvailable:
+    @njit(cache=True, boundscheck=False)
+    def _decode_frame(frame, out, sectors, fields):
+        """Header check and field decode of one uint8 frame into out"""
+        if (int(frame[0]) << 8 | int(frame[1])) != FRAME_HEADER_U16:
+            return False
+        for j in range(sectors.shape[0]):
+            i = 2 + 2 * fields[j]
+            mm = int(frame[i]) << 8 | int(frame[i + 1])
+            out[sectors[j]] = FAKE_DISTANCE if mm == 0xFFFF else min(mm // 10, MAX_DISTANCE)
+        return True
+
+    def parse_packet(buf, offset=0):
+        """Same contract as the numpy parse_packet below, decoded by _decode_frame"""
+        if len(buf) - offset < FRAME_LEN:
+            return None
+        frame = np.frombuffer(buf, np.uint8, FRAME_LEN, offset)
+        if not _decode_frame(frame, raw_cm, REPORTED_SECTORS, REPORTED_FIELDS):
+            return None
+        return raw_cm
+
+else:
+    def parse_packet(buf, offset=0):
+        """Decode the frame starting at buf[offset] in place, without slicing it out.
 
-# 📈 Kalman setup for each sector
-filters = {}
-for sid in range(1, 9):
-    kf = KalmanFilter(dim_x=1, dim_z=1)
-    kf.x = np.array([[FAKE_DISTANCE]])
-    kf.P *= 1000
-    kf.F = np.array([[1]])
-    kf.H = np.array([[1]])
-    kf.R = np.array([[100]])   # measurement noise
-    kf.Q = np.array([[0.1]])   # process noise
-    filters[sid] = kf
-
-def parse_packet(pkt):
-    d2 = int.from_bytes(pkt[2:4], 'big')
-    d3 = int.from_bytes(pkt[4:6], 'big')
-    d8 = int.from_bytes(pkt[16:18], 'big')
-    def mm_to_cm(v): return v//10 if v != 0xFFFF else FAKE_DISTANCE
-    raw = {sid: (
-        mm_to_cm(d8) if sid == 1 else
-        mm_to_cm(d2) if sid == 2 else
-        mm_to_cm(d3) if sid == 3 else
-        FAKE_DISTANCE
-    ) for sid in range(1,9)}
-    return raw
+        Returns the shared raw_cm buffer (valid until the next call), or None.
+        """
+        # Reject short or out-of-sync frames with an int compare before decoding
+        if (len(buf) - offset < FRAME_LEN
+                or (buf[offset] << 8 | buf[offset + 1]) != FRAME_HEADER_U16):
+            return None
+        # Gather the reported big-endian fields; 0xFFFF means "no target"
+        mm = np.frombuffer(buf, dtype='>u2', count=8, offset=offset + 2)[REPORTED_FIELDS]
+        # mm -> cm as a masked blend rather than a per-value branch
+        raw_cm[REPORTED_SECTORS] = np.where(mm == 0xFFFF, FAKE_DISTANCE,
+                                            np.minimum(mm // 10, MAX_DISTANCE))
+        return raw_cm
+
+def _kf_step(x, P, z, R, Q):
+    """Scalar Kalman predict/update per lane, in place"""
+    for i in range(x.shape[0]):
+        P[i] += Q
+        K = P[i] / (P[i] + R)
+        x[i] += K * (z[i] - x[i])
+        P[i] *= 1.0 - K
+
+if NumbaAvailable:
+    _kf_step = njit(cache=True, fastmath=True)(_kf_step)
+
+def warm_up_jit():
+    """Compile (or load from cache) the Numba kernels before the first radar frame.
+
+    Called from main() rather than at import, so importing the module stays cheap.
+    """
+    if NumbaAvailable:
+        parse_packet(bytearray(FRAME_LEN))  # fails the header check, writes nothing
+        _kf_step(np.zeros(8), np.ones(8), np.zeros(8), KF_R, KF_Q)
 
 def smooth(raw):
-    smoothed = {}
-    for sid, meas in raw.items():
-        kf = filters[sid]
-        kf.predict()
-        kf.update(np.array([[meas]]))
-        smoothed[sid] = float(kf.x)
-    return smoothed
-
-def send_distances(mav, dist):
+    """Run one predict/update step of all 8 sector filters in a single pass.
+
+    Returns the filter state array itself, which the next call updates in place.
+    """
+    z = np.asarray(raw, dtype=np.float64)
+    if NumbaAvailable:
+        _kf_step(kf_x, kf_P, z, KF_R, KF_Q)
+    else:
+        # Same step as _kf_step across all 8 lanes, into preallocated scratch
+        np.add(kf_P, KF_Q, out=kf_P)                  # predict
+        np.add(kf_P, KF_R, out=kf_K)
+        np.divide(kf_P, kf_K, out=kf_K)               # gain
+        np.subtract(z, kf_x, out=kf_y)
+        np.multiply(kf_K, kf_y, out=kf_y)
+        np.add(kf_x, kf_y, out=kf_x)                  # update
+        np.subtract(1.0, kf_K, out=kf_K)
+        np.multiply(kf_P, kf_K, out=kf_P)
+    return kf_x
+
+# Shared by the prebuilt message, so each send only rewrites the 8 sector slots
+obstacle_distances = array.array('H', [UINT16_MAX] * OBSTACLE_SLOTS)  # packed uint16
+
+def build_obstacle_msg():
+    """Build the OBSTACLE_DISTANCE message every send reuses.
+
+    Every field but the distances is constant. The message only exists in
+    pymavlink's MAVLink 2 dialect, so a v1 dialect is reported here.
+    """
+    if not hasattr(mavutil.mavlink, "MAVLink_obstacle_distance_message"):
+        raise RuntimeError("pymavlink has the MAVLink 1 dialect loaded; OBSTACLE_DISTANCE "
+                           "needs MAVLink 2 (set MAVLINK20=1 before importing pymavlink)")
+    return mavutil.mavlink.MAVLink_obstacle_distance_message(
+        time_usec=0, sensor_type=0, distances=obstacle_distances,
+        increment=OBSTACLE_INCREMENT, min_distance=MIN_DISTANCE,
+        max_distance=MAX_DISTANCE, increment_f=float(OBSTACLE_INCREMENT),
+        angle_offset=0.0, frame=mavutil.mavlink.MAV_FRAME_BODY_FRD
+    )
+
+last_send_time = None  # only tracked while debug logging is on
+
+def send_distances(mav, msg, dist):
     global last_send_time
-    current_time = time.time()
+    # Per-send diagnostics are debug-only; no clock read or formatting otherwise
+    if logger.isEnabledFor(logging.DEBUG):
+        current_time = time.monotonic()
+        if last_send_time is not None:
+            interval = current_time - last_send_time
+            frequency = 1.0 / interval if interval > 0 else 0
+            logger.debug("[FREQ] Send interval: %.1fms (%.1f Hz)", interval * 1000, frequency)
+        logger.debug("[SEND @ %.3f] %s", current_time,
+                     ", ".join(f"S{sid}:{int(d)}cm" for (sid, _), d in zip(SECTOR_SLOTS, dist)))
+        last_send_time = current_time
     
-    if 'last_send_time' in globals():
-        interval = current_time - last_send_time
-        frequency = 1.0 / interval if interval > 0 else 0
-        print(f"[FREQ] Send interval: {interval*1000:.1f}ms ({frequency:.1f} Hz)")
-    
-    last_send_time = current_time
-    print(f"[SEND @ {current_time:.3f}]" + ", ".join(f"S{sid}:{int(dist[sid])}cm" for sid in sorted(dist)))
-    
-    # Track if any send fails so we can trigger a reconnect upstream
-    for sid, d in dist.items():
-        try:
-            mav.mav.distance_sensor_send(
-                time_boot_ms=0, min_distance=MIN_DISTANCE,
-                max_distance=MAX_DISTANCE, current_distance=int(d),
-                type=0, id=sid,  # Use sector ID as sensor ID
-                orientation=SECTOR_ORIENTATION[sid],
-                covariance=0
-            )
-        except Exception as e:
-            # Surface the error so the caller can decide how to recover
-            raise RuntimeError(f"Failed to send distance for sector {sid}: {e}") from e
+    # All 8 sectors travel in a single OBSTACLE_DISTANCE message; the other
+    # slots are never written, so they stay UINT16_MAX without a reset
+    for (sid, orientation), d in zip(SECTOR_SLOTS, dist):
+        obstacle_distances[orientation] = int(d)
+    try:
+        mav.mav.send(msg)
+    except Exception as e:
+        # Surface the error so the caller can decide how to recover
+        raise RuntimeError(f"Failed to send distances: {e}") from e
+
+def set_low_latency(rs):
+    """Ask the tty driver for ASYNC_LOW_LATENCY so bytes aren't held for its ~16 ms timer"""
+    try:
+        rs.set_low_latency_mode(True)  # TIOCGSERIAL/TIOCSSERIAL under the hood
+        return True
+    except (AttributeError, NotImplementedError, ValueError, OSError) as e:
+        # Not every UART driver (or platform) supports it; the bridge still works
+        logger.debug("Low-latency mode unavailable on %s: %s", rs.port, e)
+        return False
+
+def raise_priority():
+    """Best effort: keep the 10 Hz loop from being preempted by camera/encoder work"""
+    try:
+        os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(RT_PRIORITY))
+        logger.info("Running with SCHED_FIFO priority %d", RT_PRIORITY)
+        return
+    except (AttributeError, OSError) as e:
+        logger.warning("SCHED_FIFO unavailable (%s), falling back to nice %d", e, FALLBACK_NICE)
+    try:
+        os.nice(FALLBACK_NICE)
+        logger.info("Running with nice %d", FALLBACK_NICE)
+    except OSError as e:
+        logger.warning("Could not raise priority (%s); grant CAP_SYS_NICE, see README_MR72.md", e)
 
-def connect_serial():
+def connect_serial(port=MR72_PORT, baud=MR72_BAUD):
     """Connect to MR72 with retry logic"""
     while True:
         try:
-            rs = serial.Serial(MR72_PORT, MR72_BAUD, timeout=1)
+            # Non-blocking: readiness comes from poll(), never a blocking read
+            rs = serial.Serial(port, baud, timeout=0)
             rs.reset_input_buffer()
-            print(f"[DEBUG] Connected to MR72 on {MR72_PORT}")
+            set_low_latency(rs)
+            logger.info("Connected to MR72 on %s", port)
             return rs
         except Exception as e:
-            print(f"[ERROR] Failed to connect to MR72: {e}")
-            print(f"[DEBUG] Retrying in {RECONNECT_DELAY} seconds...")
+            logger.error("Failed to connect to MR72: %s", e)
+            logger.info("Retrying in %s seconds...", RECONNECT_DELAY)
             time.sleep(RECONNECT_DELAY)
 
-def connect_mavlink():
+def connect_mavlink(port=FC_PORT, baud=FC_BAUD):
     """Connect to FC with retry logic"""
     while True:
         try:
-            mav = mavutil.mavlink_connection(FC_PORT, baud=FC_BAUD,
+            mav = mavutil.mavlink_connection(port, baud=baud,
                                            source_system=1, source_component=158)
+            if not mav.mavlink20():
+                # OBSTACLE_DISTANCE can't be framed as MAVLink 1; fail here, not on every send
+                raise RuntimeError("MAVLink 2 dialect not loaded (is MAVLINK20 set?)")
             mav.wait_heartbeat(timeout=5.0)
-            print(f"[DEBUG] Connected to FC on {FC_PORT}")
+            logger.info("Connected to FC on %s (MAVLink 2)", port)
             return mav
         except Exception as e:
-            print(f"[ERROR] Failed to connect to FC: {e}")
-            print(f"[DEBUG] Retrying in {RECONNECT_DELAY} seconds...")
+            logger.error("Failed to connect to FC: %s", e)
+            logger.info("Retrying in %s seconds...", RECONNECT_DELAY)
             time.sleep(RECONNECT_DELAY)
 
-def main():
-    print("[DEBUG] Starting MR72 MAVLink bridge...")
-    
-    # Initial connections
-    rs = connect_serial()
-    mav = connect_mavlink()
-    
-    last_hb = time.time()            # time we last SENT a heartbeat
-    last_fc_hb = time.time()         # time we last RECEIVED a heartbeat from FC
-    next_send = time.time()
-    last_data_time = time.time()
+def read_frames(frames, stop, uart_port=MR72_PORT, uart_baud=MR72_BAUD):
+    """Reader thread: own the MR72 UART and queue a copy of every valid frame.
+
+    Runs apart from the MAVLink side so the UART keeps draining while the
+    main loop is sending or waiting on an FC reconnect. frames is bounded;
+    when it is full the oldest frame gives way to the new one.
+    """
+    rs = connect_serial(uart_port, uart_baud)
+    fd = rs.fileno()  # read the tty directly, pyserial is only used to configure it
+    poller = select.poll()
+    poller.register(fd, select.POLLIN)
 
-    buf = bytearray()
+    monotonic_ns = time.monotonic_ns  # hot-loop lookups resolved once
+    now = last_data_time = monotonic_ns()
+    bad_frames = 0
+
+    # Fixed receive buffer: bytes live in buf[head:tail], reads land at tail
+    buf = bytearray(RX_BUF_SIZE)
+    view = memoryview(buf)
+    find, poll, readv = buf.find, poller.poll, os.readv
+    put, drop = frames.put_nowait, frames.get_nowait
+    head = tail = 0
+    while not stop.is_set():
+        try:
+            # Sleep in the kernel until bytes arrive
+            try:
+                ready = poll(READ_TIMEOUT_NS // 1_000_000)
+                now = monotonic_ns()
+                if ready:
+                    if tail > RX_BUF_SIZE - READ_CHUNK:
+                        # Slide the unparsed tail back to the front (rarely more than a frame)
+                        pending = tail - head
+                        buf[:pending] = buf[head:tail]
+                        head, tail = 0, pending
+                    n = readv(fd, [view[tail:tail + READ_CHUNK]])
+                    if not n:
+                        # Readable but empty means the device went away
+                        raise serial.SerialException("device disconnected")
+                    last_data_time = now
+                    tail += n
+            except Exception as e:
+                logger.error("Serial read failed: %s", e)
+                logger.info("Reconnecting to MR72...")
+                try:
+                    poller.unregister(fd)
+                except KeyError:
+                    pass
+                try:
+                    rs.close()
+                except Exception:
+                    pass
+                rs = connect_serial(uart_port, uart_baud)
+                fd = rs.fileno()
+                poller.register(fd, select.POLLIN)
+                head = tail = 0
+                continue
+
+            # Check for data timeout
+            if now - last_data_time > DATA_TIMEOUT_NS:
+                logger.warning("No data from MR72 for %s seconds", DATA_TIMEOUT)
+                last_data_time = now
+
+            # Queue every complete packet in buf[head:tail]
+            while True:
+                offset = find(FRAME_HEADER, head, tail)
+                if offset < 0:
+                    # Drop scanned garbage but keep a trailing 'T' that may start a header
+                    head = max(head, tail - 1)
+                    break
+                if tail - offset < FRAME_LEN:
+                    head = offset
+                    break
+                raw = parse_packet(buf, offset)
+                if raw is None:
+                    # 'TH' inside noise: resync from the next byte, not past the frame
+                    head = offset + 1
+                    bad_frames += 1
+                    if bad_frames % INVALID_LOG_EVERY == 1:
+                        logger.warning("Rejected invalid MR72 frame (%d so far)", bad_frames)
+                    continue
+                head = offset + FRAME_LEN
+                frame = raw.copy()  # raw_cm is reused by the next parse
+                try:
+                    put(frame)
+                except queue.Full:
+                    # FC side is stalled (e.g. reconnecting): keep only the newest frames.
+                    # This thread is the only producer, so the slot freed here stays free
+                    try:
+                        drop()
+                    except queue.Empty:
+                        pass
+                    put(frame)
+        except Exception as e:
+            logger.error("Unexpected error in MR72 reader: %s", e)
+            time.sleep(1)
+
+    try:
+        rs.close()
+    except Exception:
+        pass
+
+def discard_backlog(frames):
+    """Drop frames queued while the FC link was down; they are stale once it is back"""
+    try:
+        while True:
+            frames.get_nowait()
+    except queue.Empty:
+        pass
+
+def main(uart_port=MR72_PORT, uart_baud=MR72_BAUD, fc_port=FC_PORT, fc_baud=FC_BAUD,
+         realtime=False):
+    """Run the bridge; other entry points import and call this instead of copying the loop.
+
+    realtime=True raises the whole process's scheduling priority (irreversibly
+    for nice), so only the standalone script turns it on.
+    """
+    logger.info("Starting MR72 MAVLink bridge...")
+    obstacle_msg = build_obstacle_msg()  # fails fast on a MAVLink 1 dialect
+    warm_up_jit()
+    if realtime:
+        raise_priority()  # before the reader starts, so it inherits the policy
+
+    # MR72 frames arrive from the reader thread; this thread owns the FC link
+    frames = queue.Queue(maxsize=FRAME_QUEUE_SIZE)
+    stop = threading.Event()
+    reader = threading.Thread(target=read_frames, name="mr72-reader", daemon=True,
+                              args=(frames, stop, uart_port, uart_baud))
+    reader.start()
+    mav = connect_mavlink(fc_port, fc_baud)
+    discard_backlog(frames)
+    
+    # All scheduling is integer nanoseconds on the monotonic clock
+    monotonic_ns = time.monotonic_ns  # hot-loop lookups resolved once
+    get, get_nowait = frames.get, frames.get_nowait
+    now = monotonic_ns()
+    last_hb = now                    # time we last SENT a heartbeat
+    last_fc_hb = now                 # time we last RECEIVED a heartbeat from FC
+    next_send = now
     while True:
         try:
+            now = monotonic_ns()
+
             # -----------------------
             # 1) Monitor incoming heartbeat from FC
             # -----------------------
             try:
                 msg = mav.recv_match(type='HEARTBEAT', blocking=False)
                 if msg:
-                    last_fc_hb = time.time()
+                    last_fc_hb = now
             except Exception as e:
-                print(f"[ERROR] Failed to read MAVLink message: {e}")
+                logger.error("Failed to read MAVLink message: %s", e)
 
             # If we have not heard from FC recently, force reconnect
-            if time.time() - last_fc_hb > HEARTBEAT_TIMEOUT:
-                print("[WARNING] No heartbeat from FC – reconnecting...")
+            if now - last_fc_hb > HEARTBEAT_TIMEOUT_NS:
+                logger.warning("No heartbeat from FC – reconnecting...")
                 try:
                     mav.close()
                 except Exception:
                     pass
-                mav = connect_mavlink()
-                last_fc_hb = time.time()
+                mav = connect_mavlink(fc_port, fc_baud)
+                discard_backlog(frames)
+                now = last_fc_hb = monotonic_ns()
 
             # -----------------------
             # 2) Send our own heartbeat
             # -----------------------
-            if time.time() - last_hb >= 1.0:
+            if now - last_hb >= HEARTBEAT_INTERVAL_NS:
                 try:
                     mav.mav.heartbeat_send(type=6, autopilot=8,
                                            base_mode=0, custom_mode=0, system_status=4)
-                    last_hb = time.time()
+                    last_hb = now
                 except Exception as e:
-                    print(f"[ERROR] Failed to send heartbeat: {e}")
-                    print("[DEBUG] Reconnecting to FC...")
+                    logger.error("Failed to send heartbeat: %s", e)
+                    logger.info("Reconnecting to FC...")
                     try:
                         mav.close()
                     except Exception:
                         pass
-                    mav = connect_mavlink()
+                    mav = connect_mavlink(fc_port, fc_baud)
+                    discard_backlog(frames)
 
-            # Read serial data with timeout
+            # Wait for a frame, but no longer than until our next heartbeat is due
+            filtered = None
+            wait_ns = min(READ_TIMEOUT_NS, last_hb + HEARTBEAT_INTERVAL_NS - now)
             try:
-                data = rs.read(rs.in_waiting or 1)
-                if data:
-                    last_data_time = time.time()
-                    buf += data
-            except Exception as e:
-                print(f"[ERROR] Serial read failed: {e}")
-                print("[DEBUG] Reconnecting to MR72...")
-                rs = connect_serial()
-                buf.clear()
-                continue
-
-            # Check for data timeout
-            if time.time() - last_data_time > 5.0:
-                print("[WARNING] No data from MR72 for 5 seconds")
-                last_data_time = time.time()
-
-            # Parse packets
-            offset = buf.find(b'TH')
-            if offset < 0:
-                if len(buf) > 200: 
-                    buf.clear()
-                continue
-            if len(buf) - offset < 19: 
+                filtered = smooth(get(timeout=max(0, wait_ns) / NS_PER_S))
+                while True:
+                    # Frames that queued up while we were busy still feed the filter
+                    filtered = smooth(get_nowait())
+            except queue.Empty:
+                pass
+            if filtered is None:
                 continue
-
-            pkt = buf[offset:offset+19]
-            buf = buf[offset+19:]
-            raw = parse_packet(pkt)
-            filtered = smooth(raw)
+            now = monotonic_ns()
 
             # Send distances
-            if time.time() >= next_send:
+            if now >= next_send:
                 try:
-                    send_distances(mav, filtered)
+                    send_distances(mav, obstacle_msg, filtered)
                 except Exception as e:
-                    print(f"[ERROR] Distance send failed: {e}")
-                    print("[DEBUG] Reconnecting to FC...")
+                    logger.error("Distance send failed: %s", e)
+                    logger.info("Reconnecting to FC...")
                     # Close existing connection gracefully
                     try:
                         mav.close()
                     except Exception:
                         pass
-                    mav = connect_mavlink()
+                    mav = connect_mavlink(fc_port, fc_baud)
+                    discard_backlog(frames)
                 finally:
-                    next_send += SEND_INTERVAL
-                    if time.time() > next_send:
-                        next_send = time.time()
+                    next_send += SEND_INTERVAL_NS
+                    if now > next_send:
+                        next_send = now
 
         except KeyboardInterrupt:
-            print("\n[DEBUG] Shutting down...")
+            logger.info("Shutting down...")
             break
         except Exception as e:
-            print(f"[ERROR] Unexpected error: {e}")
+            logger.error("Unexpected error: %s", e)
             time.sleep(1)
 
     # Cleanup
-    try:
-        rs.close()
-    except:
-        pass
+    stop.set()
+    reader.join(timeout=1.0)  # it wakes from poll() within READ_TIMEOUT
     try:
         mav.close()
     except:
         pass
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="MR72 radar to MAVLink bridge")
+    parser.add_argument("--uart-port", default=MR72_PORT, help=f"UART port for MR72 radar (default: {MR72_PORT})")
+    parser.add_argument("--uart-baud", type=int, default=MR72_BAUD, help=f"UART baud rate (default: {MR72_BAUD})")
+    parser.add_argument("--mavlink-port", default=FC_PORT, help="MAVLink port for flight controller (default: Pixhawk 6X by-id path)")
+    parser.add_argument("--mavlink-baud", type=int, default=FC_BAUD, help=f"MAVLink baud rate (default: {FC_BAUD})")
+    parser.add_argument("--verbose", "-v", action="count", help="Enable verbose (per-send) logging")
+
+    args = parser.parse_args()
+
+    # This process is the bridge, so it picks pymavlink's dialect: OBSTACLE_DISTANCE
+    # (id 330) only exists in MAVLink 2, which needs MAVLINK20 when it is loaded
+    os.environ.setdefault("MAVLINK20", "1")
+    mavutil.set_dialect(mavutil.current_dialect)
+
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+
+    main(uart_port=args.uart_port, uart_baud=args.uart_baud,
+         fc_port=args.mavlink_port, fc_baud=args.mavlink_baud, realtime=True)
@@ -1,38 +1,102 @@
-import time, cv2
+import threading, time, cv2
 from flask import Flask, Response
 
+# PyTurboJPEG (libjpeg-turbo, NEON/SIMD) is optional; cv2.imencode is the fallback
+try:
+    from turbojpeg import TurboJPEG, TJSAMP_420  # type: ignore
+    jpeg = TurboJPEG()
+    TurboJpegAvailable = True
+except (ImportError, OSError, RuntimeError):
+    TurboJpegAvailable = False
+
 app = Flask(__name__)
 
-def generate_frames():
+# Stream the camera's own MJPG frames instead of decoding and re-encoding them.
+# Some UVC cameras send JPEGs without Huffman tables; set False if the browser chokes
+MJPG_PASSTHROUGH = True
+
+FRAME_PREFIX = b"--frame\r\nContent-Type: image/jpeg\r\n\r\n"
+
+RETRY_DELAY = 1.0  # seconds between camera reopen attempts
+
+# Latest captured frame, published by the grab thread under frame_cond
+latest_frame = None
+frame_cond = threading.Condition()
+
+def open_camera():
     # Force V4L2 backend & MJPG compression
     cap = cv2.VideoCapture(0, cv2.CAP_V4L2)
     cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*"MJPG"))
     cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)      # 640×480 keeps USB happy
     cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
     cap.set(cv2.CAP_PROP_FPS, 30)
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)         # keep at most one stale frame queued
+    if MJPG_PASSTHROUGH:
+        # V4L2 backend then hands back the compressed buffer as a 1×N uint8 array
+        cap.set(cv2.CAP_PROP_CONVERT_RGB, 0)
+    return cap
 
-    if not cap.isOpened():
-        raise RuntimeError("❌ Could not open camera")
+def grab_frames():
+    """Keep the camera drained on its own thread so JPEG encoding never delays a grab.
 
-    # Simple FPS monitor
-    frames = 0
-    t0 = time.time()
+    Never exits: a failed open or read releases the camera and reopens it, so
+    one USB hiccup doesn't end streaming for every viewer.
+    """
+    global latest_frame
+    while True:
+        cap = open_camera()
+        if not cap.isOpened():
+            print("❌ Could not open camera, retrying")
+            cap.release()
+            time.sleep(RETRY_DELAY)
+            continue
 
+        # Simple FPS monitor
+        frames = 0
+        t0 = time.time()
+
+        while True:
+            # This thread never stops reading, so with BUFFERSIZE=1 each read is fresh
+            success, frame = cap.read()
+            if not success:
+                print("❌ Camera read failed, reopening")
+                break
+
+            frames += 1
+            if frames == 120:          # every 4 s @30 fps
+                print(f"🔥 real FPS = {frames/(time.time()-t0):.1f}")
+                t0, frames = time.time(), 0
+
+            with frame_cond:
+                latest_frame = frame
+                frame_cond.notify_all()
+
+        cap.release()
+        time.sleep(RETRY_DELAY)
+
+def generate_frames():
+    last = None
     while True:
-        # Flush buffer so we always take the *latest* frame
-        cap.grab()                 # skip any queued frames
-        success, frame = cap.retrieve()
-        if not success:
-            break
+        # Sleep until the grab thread publishes a frame we haven't sent yet;
+        # while the camera is being reopened viewers simply wait
+        with frame_cond:
+            frame_cond.wait_for(lambda: latest_frame is not last)
+            frame = last = latest_frame
 
-        frames += 1
-        if frames == 120:          # every 4 s @30 fps
-            print(f"🔥 real FPS = {frames/(time.time()-t0):.1f}")
-            t0, frames = time.time(), 0
+        if frame.ndim != 3:
+            jpg = frame.tobytes()      # already a JPEG from the camera
+        elif TurboJpegAvailable:
+            # Decoded BGR (passthrough off or not honoured by the driver)
+            jpg = jpeg.encode(frame, quality=70, jpeg_subsample=TJSAMP_420)
+        else:
+            _, buf = cv2.imencode(".jpg", frame, [int(cv2.IMWRITE_JPEG_QUALITY), 70])
+            jpg = buf.tobytes()
+        # Separate chunks: the server writes them in turn, so the JPEG is never copied into a concat
+        yield FRAME_PREFIX
+        yield jpg
+        yield b"\r\n"
 
-        _, buf = cv2.imencode(".jpg", frame, [int(cv2.IMWRITE_JPEG_QUALITY), 70])
-        yield (b"--frame\r\nContent-Type: image/jpeg\r\n\r\n" +
-               buf.tobytes() + b"\r\n")
+threading.Thread(target=grab_frames, daemon=True).start()
 
 @app.route("/")
 def index():
@@ -44,5 +108,7 @@ def video_feed():
                     mimetype="multipart/x-mixed-replace; boundary=frame")
 
 if __name__ == "__main__":
-    # Use threaded=False; Flask’s threaded server can starve the grab loop
-    app.run(host="0.0.0.0", port=8080, threaded=False)
+    # Grabbing has its own thread now, so each viewer can get a request thread.
+    # For anything beyond testing, serve with gunicorn instead (one worker, it owns the camera):
+    #   gunicorn -w 1 -k gthread --threads 8 -b 0.0.0.0:8080 usb-cam-flask:app
+    app.run(host="0.0.0.0", port=8080, threaded=True)
@@ -5,8 +5,12 @@ import logging
 import os
 import platform
 import ssl
+import subprocess
 import uuid
 import time
+# Per-frame OpenCV calls are small; worker pools would only fight the capture,
+# recording and asyncio threads for cores (must be set before cv2 loads)
+os.environ.setdefault("OMP_NUM_THREADS", "1")
 import av
 import cv2
 from fractions import Fraction
@@ -14,13 +18,32 @@ from aiohttp import web
 from aiohttp_cors import setup as cors_setup, ResourceOptions, CorsViewMixin
 from aiortc import RTCPeerConnection, RTCSessionDescription, RTCConfiguration, RTCIceServer, RTCIceCandidate
 from aiortc.contrib.media import MediaPlayer, MediaRelay
-from aiortc.mediastreams import MediaStreamTrack
+from aiortc.mediastreams import MediaStreamTrack, MediaStreamError
 from aiortc.rtcrtpsender import RTCRtpSender
 from datetime import datetime
 import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# orjson is optional: faster JSON responses when installed, stdlib json otherwise
+try:
+    import orjson  # type: ignore
+    OrjsonAvailable = True
+except ImportError:
+    OrjsonAvailable = False
+
+# ffmpegcv is optional: it only backs the --codec nvenc recording path
+try:
+    import ffmpegcv  # type: ignore
+    FfmpegcvAvailable = True
+except ImportError:
+    FfmpegcvAvailable = False
 
 ROOT = os.path.dirname(__file__)
 
+cv2.setNumThreads(1)
+cv2.ocl.setUseOpenCL(False)  # CPU-only pipeline; skip OpenCL device probing
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -30,11 +53,21 @@ logger = logging.getLogger(__name__)
 
 # Connection tracking
 connection_stats = {}
+MAX_PCS = 64             # oldest peer connection is closed beyond this
+PC_REAP_INTERVAL = 10.0  # seconds between sweeps for dead peer connections
+PC_REAP_AFTER = 30.0     # seconds a connection may sit failed/closed before it is dropped
+PC_SETUP_TIMEOUT = 60.0  # seconds an unanswered offer may sit in "new"
+MAX_DIAG_ERRORS = 100    # errors kept per connection for /diagnostics
 
 # Frame grabber thread globals
 latest_frame = None
-frame_lock = threading.Lock()
+frame_seq = 0  # bumped with every published frame so tracks can tell new from old
+frame_lock = threading.Condition()  # also notified on every published frame
 frame_grabber_running = True
+# Set from the grabber thread when a frame is published; bound to the server
+# loop by the first WebcamTrack
+frame_ready = None
+frame_loop = None
 
 # Recording globals
 recording_running = True
@@ -45,8 +78,10 @@ recording_lock = threading.Lock()
 class ConnectionDiagnostics:
     def __init__(self, pc_id):
         self.pc_id = pc_id
-        self.start_time = datetime.now()
-        self.ice_candidates = []
+        # Event times are monotonic seconds since start_time; wall clock is read once
+        self.start_time = time.monotonic()
+        self.start_wall = datetime.now()
+        self.ice_candidates = 0  # only the count is reported, so don't keep them
         self.connection_attempts = 0
         self.last_state = None
         self.last_ice_state = None
@@ -54,7 +89,7 @@ class ConnectionDiagnostics:
         self.errors = []
 
     def log_state_change(self, state_type, new_state):
-        timestamp = datetime.now()
+        elapsed = time.monotonic() - self.start_time
         if state_type == "connection":
             self.last_state = new_state
         elif state_type == "ice":
@@ -62,11 +97,13 @@ class ConnectionDiagnostics:
         elif state_type == "signaling":
             self.last_signaling_state = new_state
         
-        logger.info(f"PC {self.pc_id} - {state_type} state changed to {new_state} at {timestamp}")
+        logger.info(f"PC {self.pc_id} - {state_type} state changed to {new_state} at +{elapsed:.3f}s")
 
     def log_error(self, error):
+        if len(self.errors) >= MAX_DIAG_ERRORS:
+            del self.errors[0]
         self.errors.append({
-            "timestamp": datetime.now(),
+            "timestamp": time.monotonic() - self.start_time,
             "error": str(error)
         })
         logger.error(f"PC {self.pc_id} - Error: {error}")
@@ -74,72 +111,127 @@ class ConnectionDiagnostics:
     def get_stats(self):
         return {
             "pc_id": self.pc_id,
-            "uptime": (datetime.now() - self.start_time).total_seconds(),
+            "started": self.start_wall.isoformat(),
+            "uptime": time.monotonic() - self.start_time,
             "connection_attempts": self.connection_attempts,
             "current_states": {
                 "connection": self.last_state,
                 "ice": self.last_ice_state,
                 "signaling": self.last_signaling_state
             },
-            "ice_candidates": len(self.ice_candidates),
+            "ice_candidates": self.ice_candidates,
             "errors": self.errors
         }
 
+# (fourcc, extension) found by detect_codec, per preferred codec and frame size
+codec_cache = {}
+
+def detect_codec(preferred_codec, fps, width, height):
+    """Find a codec VideoWriter can open on Windows; probed once, then cached.
+
+    Recordings rotate every minute, and each probe creates and deletes test files.
+    """
+    key = (preferred_codec, fps, width, height)
+    if key in codec_cache:
+        return codec_cache[key]
+
+    # Define codec preferences based on user choice
+    if preferred_codec == "auto":
+        codecs_to_try = [
+            ('mp4v', 'mp4v'),
+            ('XVID', 'avi'),  # Fallback to AVI with XVID
+            ('MJPG', 'avi'),  # Another AVI option
+            ('H264', 'mp4')   # Last resort H264
+        ]
+    elif preferred_codec == "mp4v":
+        codecs_to_try = [('mp4v', 'mp4v')]
+    elif preferred_codec == "xvid":
+        codecs_to_try = [('XVID', 'avi'), ('mp4v', 'mp4v')]
+    elif preferred_codec == "mjpg":
+        codecs_to_try = [('MJPG', 'avi'), ('mp4v', 'mp4v')]
+    elif preferred_codec == "h264":
+        codecs_to_try = [('H264', 'mp4'), ('mp4v', 'mp4v')]
+    else:
+        codecs_to_try = [('mp4v', 'mp4v')]
+    
+    result = None
+    for codec_name, extension in codecs_to_try:
+        try:
+            test_filename = f"test.{extension}"
+            test_fourcc = cv2.VideoWriter_fourcc(*codec_name)
+            test_writer = cv2.VideoWriter(test_filename, test_fourcc, fps, (width, height))
+            if test_writer.isOpened():
+                test_writer.release()
+                if os.path.exists(test_filename):
+                    os.remove(test_filename)
+                result = (test_fourcc, extension)
+                logger.info(f"Using codec: {codec_name} for recording")
+                break
+            else:
+                test_writer.release()
+        except Exception as e:
+            logger.debug(f"Codec {codec_name} failed: {e}")
+            continue
+    
+    if result is None:
+        # Ultimate fallback - use default
+        result = (cv2.VideoWriter_fourcc(*'mp4v'), None)
+        logger.warning("All codecs failed, using default mp4v")
+    
+    codec_cache[key] = result
+    return result
+
+# Whether OpenCV's FFmpeg has a hardware H.264 encoder; answered by the first
+# _open_hw_writer() and fixed for the process, so rotations don't re-probe
+hw_writer_available = None
+nvenc_available = None  # set by the first nvenc_works() probe
+
+def nvenc_works():
+    """Whether ffmpeg can really encode with h264_nvenc; probed once, then cached.
+
+    ffmpegcv only starts ffmpeg on the first write(), so opening its writer
+    succeeds (and isOpened() is true) even without a usable NVIDIA GPU.
+    """
+    global nvenc_available
+    if nvenc_available is None:
+        try:
+            result = subprocess.run(
+                ["ffmpeg", "-hide_banner", "-loglevel", "error",
+                 "-f", "lavfi", "-i", "color=black:s=256x256", "-frames:v", "1",
+                 "-c:v", "h264_nvenc", "-f", "null", "-"],
+                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=15)
+            nvenc_available = result.returncode == 0
+            if not nvenc_available:
+                logger.warning(f"h264_nvenc unusable: {result.stderr.decode(errors='replace').strip()}")
+        except (OSError, subprocess.TimeoutExpired) as e:
+            logger.warning(f"h264_nvenc probe failed: {e}")
+            nvenc_available = False
+    return nvenc_available
+
 class VideoRecorder:
-    def __init__(self, filename, fps=30, width=960, height=540, preferred_codec="auto"):
+    def __init__(self, filename, fps=30, width=None, height=None, preferred_codec="auto"):
         self.filename = filename
         self.fps = fps
-        self.width = width
-        self.height = height
+        # Record at the capture size unless told otherwise, so frames go in without a
+        # resize. Read it off the published frame: cap belongs to the grabber thread
+        if width is None or height is None:
+            with frame_lock:
+                frame = latest_frame
+            if frame is not None:
+                frame_height, frame_width = frame.shape[:2]
+                width = width or frame_width
+                height = height or frame_height
+        self.width = width or 960
+        self.height = height or 540
+        self.preferred_codec = preferred_codec
         
         # Try different codecs based on platform with better error handling
-        self.fourcc = None
         if platform.system() == "Windows":
-            # Define codec preferences based on user choice
-            if preferred_codec == "auto":
-                codecs_to_try = [
-                    ('mp4v', 'mp4v'),
-                    ('XVID', 'avi'),  # Fallback to AVI with XVID
-                    ('MJPG', 'avi'),  # Another AVI option
-                    ('H264', 'mp4')   # Last resort H264
-                ]
-            elif preferred_codec == "mp4v":
-                codecs_to_try = [('mp4v', 'mp4v')]
-            elif preferred_codec == "xvid":
-                codecs_to_try = [('XVID', 'avi'), ('mp4v', 'mp4v')]
-            elif preferred_codec == "mjpg":
-                codecs_to_try = [('MJPG', 'avi'), ('mp4v', 'mp4v')]
-            elif preferred_codec == "h264":
-                codecs_to_try = [('H264', 'mp4'), ('mp4v', 'mp4v')]
-            else:
-                codecs_to_try = [('mp4v', 'mp4v')]
-            
-            for codec_name, extension in codecs_to_try:
-                try:
-                    test_filename = f"test.{extension}"
-                    test_fourcc = cv2.VideoWriter_fourcc(*codec_name)
-                    test_writer = cv2.VideoWriter(test_filename, test_fourcc, fps, (width, height))
-                    if test_writer.isOpened():
-                        test_writer.release()
-                        if os.path.exists(test_filename):
-                            os.remove(test_filename)
-                        self.fourcc = test_fourcc
-                        # Update filename extension if needed
-                        if extension != 'mp4':
-                            base_name = os.path.splitext(filename)[0]
-                            self.filename = f"{base_name}.{extension}"
-                        logger.info(f"Using codec: {codec_name} for recording")
-                        break
-                    else:
-                        test_writer.release()
-                except Exception as e:
-                    logger.debug(f"Codec {codec_name} failed: {e}")
-                    continue
-            
-            if self.fourcc is None:
-                # Ultimate fallback - use default
-                self.fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-                logger.warning("All codecs failed, using default mp4v")
+            self.fourcc, extension = detect_codec(preferred_codec, fps, self.width, self.height)
+            # Update filename extension if needed
+            if extension is not None and extension != 'mp4':
+                base_name = os.path.splitext(filename)[0]
+                self.filename = f"{base_name}.{extension}"
         else:
             # Linux/Mac - use MP4V
             self.fourcc = cv2.VideoWriter_fourcc(*'mp4v')
@@ -147,10 +239,60 @@ class VideoRecorder:
         self.out = None
         self.frame_count = 0
         self.start_time = time.time()
+        # Resize decision, interpolation and output buffer, fixed by the first frame
+        self._resize = None
+        self._interp = cv2.INTER_LINEAR
+        self._resized = None
         
+    def _open_hw_writer(self):
+        """H.264 through FFmpeg on the GPU/SoC encoder (VAAPI, NVENC, MFX...), if OpenCV has one"""
+        global hw_writer_available
+        if not hasattr(cv2, "VIDEOWRITER_PROP_HW_ACCELERATION") or not self.filename.endswith(".mp4"):
+            return None  # OpenCV < 4.5.2, or a container picked for a non-H.264 codec
+        if hw_writer_available is False:
+            return None  # probed on an earlier rotation; the build has no hardware encoder
+        try:
+            out = cv2.VideoWriter(self.filename, cv2.CAP_FFMPEG, cv2.VideoWriter_fourcc(*'avc1'),
+                                  self.fps, (self.width, self.height),
+                                  [cv2.VIDEOWRITER_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY])
+            # ACCELERATION_ANY also opens with a software H.264 encoder; only keep
+            # the writer if FFmpeg really picked a hardware one
+            if (out.isOpened() and out.get(cv2.VIDEOWRITER_PROP_HW_ACCELERATION)
+                    != cv2.VIDEO_ACCELERATION_NONE):
+                if hw_writer_available is None:
+                    logger.info("Using hardware-accelerated H.264 for recording")
+                hw_writer_available = True
+                return out
+            out.release()
+        except cv2.error as e:
+            logger.debug(f"Hardware video writer unavailable: {e}")
+        hw_writer_available = False
+        return None
+
+    def _open_nvenc_writer(self):
+        """ffmpegcv pipe into h264_nvenc; BGR frames go to ffmpeg as-is"""
+        if not FfmpegcvAvailable:
+            logger.warning("--codec nvenc needs the ffmpegcv package, falling back")
+            return None
+        if not nvenc_works():
+            logger.warning("NVENC not available, falling back")
+            return None
+        try:
+            out = ffmpegcv.VideoWriterNV(self.filename, 'h264', self.fps)
+            logger.info("Using NVENC (ffmpegcv) for recording")
+            return out
+        except Exception as e:
+            logger.warning(f"NVENC writer unavailable, falling back: {e}")
+            return None
+
     def start(self):
         try:
-            self.out = cv2.VideoWriter(self.filename, self.fourcc, self.fps, (self.width, self.height))
+            self.out = self._open_nvenc_writer() if self.preferred_codec == "nvenc" else None
+            if self.out is None:
+                self.out = self._open_hw_writer()
+            if self.out is None:
+                # Software encode with the codec picked in __init__
+                self.out = cv2.VideoWriter(self.filename, self.fourcc, self.fps, (self.width, self.height))
             if not self.out.isOpened():
                 logger.error(f"Failed to open video writer for {self.filename}")
                 return False
@@ -160,14 +302,23 @@ class VideoRecorder:
             logger.error(f"Error starting recording {self.filename}: {e}")
             return False
     
-    def write_frame(self, frame):
+    def write_frame(self, frame, count=1):
+        """Write frame count times (repeats keep the file's fps in real time)"""
         if self.out and self.out.isOpened():
             try:
-                # Resize frame if needed
-                if frame.shape[1] != self.width or frame.shape[0] != self.height:
-                    frame = cv2.resize(frame, (self.width, self.height))
-                self.out.write(frame)
-                self.frame_count += 1
+                if self._resize is None:
+                    h, w = frame.shape[:2]
+                    self._resize = (w, h) != (self.width, self.height)
+                    # INTER_AREA is the cheap, alias-free choice when shrinking
+                    if w > self.width or h > self.height:
+                        self._interp = cv2.INTER_AREA
+                if self._resize:
+                    # Reuses the same output buffer after the first frame
+                    frame = self._resized = cv2.resize(frame, (self.width, self.height),
+                                                       dst=self._resized, interpolation=self._interp)
+                for _ in range(count):
+                    self.out.write(frame)
+                self.frame_count += count
                 return True
             except Exception as e:
                 logger.error(f"Error writing frame to {self.filename}: {e}")
@@ -193,6 +344,7 @@ def recording_worker():
     video_dir = os.path.join(ROOT, "video")
     os.makedirs(video_dir, exist_ok=True)
     
+    last_seq = frame_seq
     while recording_running:
         try:
             # Create new recording file with timestamp in video folder
@@ -211,17 +363,36 @@ def recording_worker():
                     continue
             
             # Record for 1 minute (60 seconds)
-            start_time = time.time()
-            while recording_running and (time.time() - start_time) < 60:
+            # One monotonic clock for both rotation and frame pacing
+            start_time = pace_start = time.monotonic()
+            stalled = False
+            while recording_running and (time.monotonic() - start_time) < 60:
+                # Wake on each new camera frame; the timeout keeps the stop/rotation
+                # checks alive if the camera stalls
                 with frame_lock:
-                    frame = None if latest_frame is None else latest_frame.copy()
-                
-                if frame is not None:
-                    with recording_lock:
-                        if current_recording:
-                            current_recording.write_frame(frame)
+                    if not frame_lock.wait_for(lambda: frame_seq != last_seq, timeout=1.0):
+                        stalled = True
+                        continue
+                    frame, last_seq = latest_frame, frame_seq  # never written after publishing
                 
-                time.sleep(0.033)  # ~30 FPS
+                with recording_lock:
+                    if current_recording:
+                        fps = current_recording.fps
+                        now = time.monotonic()
+                        if stalled:
+                            # Don't backfill a stall (a camera reinit can take seconds)
+                            # with one frame repeated inside recording_lock; the HTTP
+                            # handlers take that lock on the event loop. Resume from here
+                            pace_start = now - current_recording.frame_count / fps
+                            stalled = False
+                        # The writer's fps is fixed, so hold it against the wall clock:
+                        # repeat the frame when the camera runs slower (low-light MJPG
+                        # often drops to 15 fps), skip it when the camera runs faster.
+                        # At most a second's worth per frame bounds the time in the lock
+                        due = min(int((now - pace_start) * fps) + 1 - current_recording.frame_count,
+                                  int(fps))
+                        if due > 0:
+                            current_recording.write_frame(frame, due)
 
             
             # Stop current recording
@@ -237,7 +408,8 @@ def recording_worker():
 relay = None
 webcam = None
 cap = None
-pcs = {}
+pcs = OrderedDict()  # insertion order = age, for eviction
+pc_reaper = None
 
 def initialize_camera():
     global cap
@@ -308,8 +480,30 @@ def initialize_camera():
     print("❌ No working camera found after trying all combinations")
     return False
 
+def pin_grabber_thread():
+    """Give the calling (grabber) thread the last CPU and, if allowed, SCHED_RR.
+
+    Keeps capture off the cores the event loop and encoder run on, so frame
+    timing doesn't jitter with their load. Linux only; best effort elsewhere.
+    """
+    cpus = os.sched_getaffinity(0) if hasattr(os, "sched_getaffinity") else set()
+    if len(cpus) > 1:
+        try:
+            os.sched_setaffinity(0, {max(cpus)})  # 0 = calling thread on Linux
+            print(f"[FrameGrabber] Pinned to CPU {max(cpus)}")
+        except OSError as e:
+            print(f"[FrameGrabber] Could not pin to a CPU: {e}")
+    if hasattr(os, "sched_setscheduler"):
+        try:
+            os.sched_setscheduler(0, os.SCHED_RR, os.sched_param(10))
+            print("[FrameGrabber] Using SCHED_RR priority 10")
+        except OSError as e:
+            # Needs root or CAP_SYS_NICE (startup.service grants it)
+            print(f"[FrameGrabber] SCHED_RR unavailable, using default scheduling: {e}")
+
 def frame_grabber():
-    global latest_frame, frame_grabber_running, cap
+    global latest_frame, frame_seq, frame_grabber_running, cap
+    pin_grabber_thread()
     frame_count = 0
     t0 = time.time()
     consecutive_failures = 0
@@ -321,8 +515,15 @@ def frame_grabber():
                 # Use read() instead of grab() + retrieve() for better reliability
                 success, frame = cap.read()
                 if success and frame is not None:
+                    # read() allocates a new array every call and nothing writes to a
+                    # published frame, so consumers share it by reference without copies
                     with frame_lock:
-                        latest_frame = frame.copy()
+                        latest_frame = frame
+                        frame_seq += 1
+                        frame_lock.notify_all()
+                    loop, ready = frame_loop, frame_ready
+                    if loop is not None and ready is not None and not loop.is_closed():
+                        loop.call_soon_threadsafe(ready.set)
                     frame_count += 1
                     consecutive_failures = 0  # Reset failure counter on success
                 else:
@@ -377,8 +578,7 @@ def frame_grabber():
                     print(f"[FrameGrabber] Failed to reinitialize camera: {reinit_error}")
                     consecutive_failures = 0  # Reset to avoid spam
                     time.sleep(1)
-        
-        time.sleep(0.001)  # Small delay to prevent excessive CPU usage
+        # No sleep here: cap.read() blocks until the camera delivers the next frame
 
 # Start the frame grabber thread after camera initialization
 if not initialize_camera():
@@ -399,101 +599,184 @@ class WebcamTrack(MediaStreamTrack):
     kind = "video"
 
     def __init__(self):
+        global frame_ready, frame_loop
         super().__init__()
         self._retry_count = 0
         self._max_retries = 3
+        self._last_seq = -1
+        self._t0 = time.monotonic_ns()  # pts origin; immune to wall-clock steps
+        self._yuv = None  # I420 conversion buffer, reused every frame
+        # cvtColor releases the GIL, so run it here and keep ICE/DTLS/RTP timing on the loop
+        self._convert = ThreadPoolExecutor(max_workers=1, thread_name_prefix="webcam-convert")
+        # Tracks are created inside the server loop, so bind the event to it once
+        if frame_ready is None:
+            # Event first: the grabber treats a set frame_loop as "frame_ready is usable"
+            frame_ready = asyncio.Event()
+            frame_loop = asyncio.get_running_loop()
+
+    def _to_i420(self, frame):
+        # Convert once with OpenCV's SIMD path into the encoder's native
+        # yuv420p, so PyAV's reformat before encoding is a no-op
+        self._yuv = cv2.cvtColor(frame, cv2.COLOR_BGR2YUV_I420, dst=self._yuv)
+        return self._yuv
+
+    def stop(self):
+        super().stop()
+        self._convert.shutdown(wait=False)
 
     async def recv(self):
         global latest_frame
         while True:
+            if self.readyState != "live":
+                # Stopped by release_idle_webcam; ends the relay's read loop
+                raise MediaStreamError
+            # Shared by reference; see frame_grabber
             with frame_lock:
-                frame = None if latest_frame is None else latest_frame.copy()
-            if frame is not None:
-                frame_rgba = cv2.cvtColor(frame, cv2.COLOR_BGR2RGBA)
-                frame_rgba = frame_rgba.astype('uint8')
-                pts = time.time() * 1000000
-                new_frame = av.VideoFrame.from_ndarray(frame_rgba, format='rgba')
-                new_frame.pts = int(pts)
+                frame, seq = latest_frame, frame_seq
+            if frame is not None and seq != self._last_seq:
+                self._last_seq = seq
+                # One conversion in flight at a time, so the shared buffer is never
+                # overwritten before from_ndarray has copied it
+                yuv = await frame_loop.run_in_executor(self._convert, self._to_i420, frame)
+                new_frame = av.VideoFrame.from_ndarray(yuv, format='yuv420p')
+                new_frame.pts = (time.monotonic_ns() - self._t0) // 1000
                 new_frame.time_base = Fraction(1, 1000000)
                 return new_frame
-            await asyncio.sleep(0.005)  # Slight delay while waiting
+            # Sleep until the grabber publishes; a set() for any frame newer than
+            # the check above runs after this clear(), so no frame is missed
+            frame_ready.clear()
+            await frame_ready.wait()
+
+
+def json_response(obj, status=200):
+    """JSON web.Response; values JSON can't represent (datetimes, ...) become strings"""
+    if OrjsonAvailable:
+        body = orjson.dumps(obj, default=str)
+    else:
+        body = json.dumps(obj, ensure_ascii=False, default=str).encode("utf-8")
+    return web.Response(body=body, status=status, content_type="application/json")
+
+# RTP video codec offered first to viewers. aiortc encodes H.264 with software
+# libx264 (zerolatency tune), which costs less CPU per frame than its
+# libvpx VP8 encoder; browsers also decode H.264 in hardware more often
+video_codec = "video/H264"
 
+def prefer_codec(pc, sender, preferred_codec):
+    """Offer preferred_codec first, keeping the others as fallbacks.
+
+    Browsers without it (Chromium without proprietary codecs, Firefox before
+    OpenH264 is fetched) still negotiate one of the remaining codecs.
+    """
+    kind = preferred_codec.split("/")[0]
+    codecs = RTCRtpSender.getCapabilities(kind).codecs
+    transceiver = next(t for t in pc.getTransceivers() if t.sender == sender)
+    transceiver.setCodecPreferences(
+        sorted(codecs, key=lambda codec: codec.mimeType != preferred_codec)
+    )
+
+# Read once; index() would otherwise block the event loop on disk for every GET
+with open(os.path.join(ROOT, "client.html"), "rb") as f:
+    INDEX_HTML = f.read()
 
 async def index(request):
-    content = open(os.path.join(ROOT, "client.html"), "r").read()
-    return web.Response(content_type="text/html", text=content)
+    return web.Response(content_type="text/html", charset="utf-8", body=INDEX_HTML)
+
+# STUN/TURN servers with TURN support; immutable, so built once for every offer
+ICE_CONFIG = RTCConfiguration(
+    iceServers=[
+        RTCIceServer(
+            urls=[
+                "stun:stun.l.google.com:19302",
+                "stun:stun1.l.google.com:19302",
+                "stun:stun2.l.google.com:19302",
+                "stun:stun3.l.google.com:19302",
+                "stun:stun4.l.google.com:19302"
+            ]
+        ),
+        RTCIceServer(
+            urls=[
+                "turn:openrelay.metered.ca:80",
+                "turn:openrelay.metered.ca:443",
+                "turn:openrelay.metered.ca:443?transport=tcp"
+            ],
+            username="openrelayproject",
+            credential="openrelayproject"
+        ),
+        RTCIceServer(
+            urls=[
+                "turn:numb.viagenie.ca",
+                "stun:numb.viagenie.ca"
+            ],
+            username="webrtc@live.com",
+            credential="muazkh"
+        ),
+        # Add more reliable TURN servers
+        RTCIceServer(
+            urls=[
+                "turn:turn.anyfirewall.com:443?transport=tcp",
+                "turn:turn.anyfirewall.com:443?transport=udp"
+            ],
+            username="webrtc",
+            credential="webrtc"
+        ),
+        RTCIceServer(
+            urls=[
+                "turn:turn.bistri.com:80",
+                "turn:turn.bistri.com:443"
+            ],
+            username="homeo",
+            credential="homeo"
+        )
+    ]
+)
+
+# The same servers as plain dicts, for the offer response
+ICE_SERVERS_JSON = [
+    {"urls": server.urls, "username": getattr(server, "username", None), "credential": getattr(server, "credential", None)}
+    for server in (ICE_CONFIG.iceServers or [])
+]
+
+def release_idle_webcam():
+    """Stop the shared source track once no peer connection can still use it.
+
+    MediaRelay keeps reading its source after the last subscriber stops, so
+    without this the I420 conversion would run at camera rate with nobody
+    watching. The next offer builds a fresh relay and track.
+    """
+    global relay, webcam
+    if webcam is not None and all(pc.connectionState == "closed" for pc in pcs.values()):
+        logger.info("No viewers left, stopping the WebRTC source track")
+        webcam.stop()
+        relay = webcam = None
 
 async def webrtc(request):
+    global relay, webcam
     if request.method == "GET":
         # Handle GET request
-        return web.Response(
-            content_type="application/json",
-            text=json.dumps({"status": "ready"}, ensure_ascii=False)
-        )
+        return json_response({"status": "ready"})
     
     params = await request.json()
     if params["type"] == "request":
-        # Configure STUN/TURN servers with TURN support
-        configuration = RTCConfiguration(
-            iceServers=[
-                RTCIceServer(
-                    urls=[
-                        "stun:stun.l.google.com:19302",
-                        "stun:stun1.l.google.com:19302",
-                        "stun:stun2.l.google.com:19302",
-                        "stun:stun3.l.google.com:19302",
-                        "stun:stun4.l.google.com:19302"
-                    ]
-                ),
-                RTCIceServer(
-                    urls=[
-                        "turn:openrelay.metered.ca:80",
-                        "turn:openrelay.metered.ca:443",
-                        "turn:openrelay.metered.ca:443?transport=tcp"
-                    ],
-                    username="openrelayproject",
-                    credential="openrelayproject"
-                ),
-                RTCIceServer(
-                    urls=[
-                        "turn:numb.viagenie.ca",
-                        "stun:numb.viagenie.ca"
-                    ],
-                    username="webrtc@live.com",
-                    credential="muazkh"
-                ),
-                # Add more reliable TURN servers
-                RTCIceServer(
-                    urls=[
-                        "turn:turn.anyfirewall.com:443?transport=tcp",
-                        "turn:turn.anyfirewall.com:443?transport=udp"
-                    ],
-                    username="webrtc",
-                    credential="webrtc"
-                ),
-                RTCIceServer(
-                    urls=[
-                        "turn:turn.bistri.com:80",
-                        "turn:turn.bistri.com:443"
-                    ],
-                    username="homeo",
-                    credential="homeo"
-                )
-            ]
-        )
-        
-        pc = RTCPeerConnection(configuration)
+        pc = RTCPeerConnection(ICE_CONFIG)
         pc_id = "PeerConnection(%s)" % uuid.uuid4()
+        while len(pcs) >= MAX_PCS:
+            old_id, old_pc = pcs.popitem(last=False)
+            connection_stats.pop(old_id, None)
+            logger.warning(f"Too many peer connections, closing oldest: {old_id}")
+            await old_pc.close()
         pcs[pc_id] = pc
         
         # Initialize diagnostics
         diag = ConnectionDiagnostics(pc_id)
         connection_stats[pc_id] = diag
+        gather_done = asyncio.get_running_loop().create_future()
 
         @pc.on("connectionstatechange")
         async def on_connectionstatechange():
             diag.log_state_change("connection", pc.connectionState)
             logger.info(f"Connection state changed to: {pc.connectionState}")
+            if pc.connectionState == "closed":
+                release_idle_webcam()
             if pc.connectionState == "failed":
                 diag.connection_attempts += 1
                 logger.warning(f"Connection failed (attempt {diag.connection_attempts})")
@@ -530,6 +813,8 @@ async def webrtc(request):
         async def on_icegatheringstatechange():
             diag.log_state_change("ice", pc.iceGatheringState)
             logger.info(f"ICE gathering state changed to: {pc.iceGatheringState}")
+            if pc.iceGatheringState == "complete" and not gather_done.done():
+                gather_done.set_result(None)
 
         @pc.on("signalingstatechange")
         async def on_signalingstatechange():
@@ -538,78 +823,59 @@ async def webrtc(request):
         @pc.on("icecandidate")
         async def on_icecandidate(candidate):
             if candidate:
-                diag.ice_candidates.append({
-                    "timestamp": datetime.now(),
-                    "candidate": str(candidate)
-                })
+                diag.ice_candidates += 1
                 logger.info(f"New ICE candidate: {candidate}")
 
-        webcam = WebcamTrack()
-        pc.addTrack(webcam)
+        # One source track for all viewers: frames are converted once, and the
+        # unbuffered relay drops frames for a slow client instead of queueing them
+        if webcam is None:
+            relay = MediaRelay()
+            webcam = WebcamTrack()
+        sender = pc.addTrack(relay.subscribe(webcam, buffered=False))
+        if video_codec:
+            prefer_codec(pc, sender, video_codec)
         
         try:
             offer = await pc.createOffer()
             await pc.setLocalDescription(offer)
 
-            # Wait for ICE gathering to complete with timeout
-            try:
-                async with asyncio.timeout(10):  # 10 second timeout
-                    while True:
-                        if pc.iceGatheringState == "complete":
-                            break
-                        await asyncio.sleep(0.1)
-            except asyncio.TimeoutError:
-                logger.warning("ICE gathering timed out, proceeding with available candidates")
-
-            return web.Response(
-                content_type="application/json",
-                text=json.dumps({
-                    "sdp": pc.localDescription.sdp,
-                    "type": pc.localDescription.type,
-                    "id": pc_id,
-                    "iceServers": [{"urls": server.urls, "username": getattr(server, "username", None), "credential": getattr(server, "credential", None)} for server in (configuration.iceServers or [])],
-                    "diagnostics": diag.get_stats()
-                }, ensure_ascii=False)
-            )
+            # Wait for ICE gathering to complete with timeout; woken by the
+            # state-change callback rather than polled
+            if pc.iceGatheringState != "complete":
+                try:
+                    await asyncio.wait_for(gather_done, timeout=10)  # 10 second timeout
+                except asyncio.TimeoutError:
+                    logger.warning("ICE gathering timed out, proceeding with available candidates")
+
+            return json_response({
+                "sdp": pc.localDescription.sdp,
+                "type": pc.localDescription.type,
+                "id": pc_id,
+                "iceServers": ICE_SERVERS_JSON,
+                "diagnostics": diag.get_stats()
+            })
         except Exception as e:
             diag.log_error(f"Error creating offer: {e}")
             raise
     elif params["type"] == "answer":
-        pc = pcs[params["id"]]
+        pc = pcs.get(params["id"])
 
         if not pc:
-            return web.Response(
-                content_type="application/json",
-                text=json.dumps({"error": "Peer connection not found"}, ensure_ascii=False)
-            )
+            return json_response({"error": "Peer connection not found"})
             
         await pc.setRemoteDescription(RTCSessionDescription(sdp=params["sdp"], type=params["type"]))
 
-        return web.Response(
-            content_type="application/json",
-            text=json.dumps({"status": "success"}, ensure_ascii=False)
-        )
+        return json_response({"status": "success"})
     
     # Default response for unhandled cases
-    return web.Response(
-        content_type="application/json",
-        text=json.dumps({"error": "Invalid request type"}, ensure_ascii=False),
-        status=400
-    )
+    return json_response({"error": "Invalid request type"}, status=400)
 
 async def get_diagnostics(request):
     """Endpoint to get connection diagnostics"""
     pc_id = request.query.get('id')
     if pc_id and pc_id in connection_stats:
-        return web.Response(
-            content_type="application/json",
-            text=json.dumps(connection_stats[pc_id].get_stats(), ensure_ascii=False)
-        )
-    return web.Response(
-        content_type="application/json",
-        text=json.dumps({"error": "Connection not found"}, ensure_ascii=False),
-        status=404
-    )
+        return json_response(connection_stats[pc_id].get_stats())
+    return json_response({"error": "Connection not found"}, status=404)
 
 async def recording_status(request):
     """Endpoint to get recording status and control recording"""
@@ -623,10 +889,7 @@ async def recording_status(request):
             "current_file": current_recording.filename if current_recording else None,
             "frame_count": current_recording.frame_count if current_recording else 0
         }
-        return web.Response(
-            content_type="application/json",
-            text=json.dumps(status, ensure_ascii=False)
-        )
+        return json_response(status)
     
     elif request.method == "POST":
         # Control recording
@@ -640,10 +903,7 @@ async def recording_status(request):
                 if not recording_thread or not recording_thread.is_alive():
                     recording_thread = threading.Thread(target=recording_worker, daemon=True)
                     recording_thread.start()
-                return web.Response(
-                    content_type="application/json",
-                    text=json.dumps({"status": "Recording started"}, ensure_ascii=False)
-                )
+                return json_response({"status": "Recording started"})
             
             elif action == "stop" and recording_running:
                 recording_running = False
@@ -651,27 +911,47 @@ async def recording_status(request):
                     if current_recording:
                         current_recording.stop()
                         current_recording = None
-                return web.Response(
-                    content_type="application/json",
-                    text=json.dumps({"status": "Recording stopped"}, ensure_ascii=False)
-                )
+                return json_response({"status": "Recording stopped"})
             
             else:
-                return web.Response(
-                    content_type="application/json",
-                    text=json.dumps({"error": "Invalid action or already in requested state"}, ensure_ascii=False),
-                    status=400
-                )
+                return json_response({"error": "Invalid action or already in requested state"}, status=400)
                 
         except Exception as e:
-            return web.Response(
-                content_type="application/json",
-                text=json.dumps({"error": str(e)}, ensure_ascii=False),
-                status=500
-            )
+            return json_response({"error": str(e)}, status=500)
+
+async def reap_peer_connections():
+    """Close and forget peer connections that died or whose offer was never answered"""
+    stale_since = {}
+    while True:
+        await asyncio.sleep(PC_REAP_INTERVAL)
+        now = time.monotonic()
+        for pc_id, pc in list(pcs.items()):
+            state = pc.connectionState
+            if state in ("failed", "closed"):
+                limit = PC_REAP_AFTER
+            elif state == "new":
+                limit = PC_SETUP_TIMEOUT
+            else:
+                stale_since.pop(pc_id, None)
+                continue
+            if now - stale_since.setdefault(pc_id, now) >= limit:
+                logger.info(f"Reaping {state} peer connection {pc_id}")
+                pcs.pop(pc_id, None)
+                connection_stats.pop(pc_id, None)
+                stale_since.pop(pc_id, None)
+                await pc.close()
+        # Forget entries whose connection was evicted elsewhere
+        for pc_id in [i for i in stale_since if i not in pcs]:
+            del stale_since[pc_id]
+
+async def on_startup(app):
+    global pc_reaper
+    pc_reaper = asyncio.create_task(reap_peer_connections())
 
 async def on_shutdown(app):
     global frame_grabber_running, recording_running, current_recording
+    if pc_reaper is not None:
+        pc_reaper.cancel()
     # close peer connections
     coros = [pc.close() for pc in pcs.values()]
     await asyncio.gather(*coros)
@@ -704,7 +984,7 @@ async def mjpeg_stream(request):
     await response.prepare(request)
     while True:
         with frame_lock:
-            frame = None if latest_frame is None else latest_frame.copy()
+            frame = latest_frame
         if frame is not None:
             ret, jpeg = cv2.imencode('.jpg', frame)
             if ret:
@@ -721,8 +1001,10 @@ if __name__ == "__main__":
     parser.add_argument("--cert-file", help="SSL certificate file (optional)")
     parser.add_argument("--key-file", help="SSL key file (optional)")
     parser.add_argument("--no-recording", action="store_true", help="Disable video recording")
-    parser.add_argument("--codec", default="auto", choices=["auto", "mp4v", "xvid", "mjpg", "h264"], 
+    parser.add_argument("--codec", default="auto", choices=["auto", "mp4v", "xvid", "mjpg", "h264", "nvenc"], 
                        help="Preferred video codec for recording (default: auto)")
+    parser.add_argument("--video-codec", default="h264", choices=["h264", "vp8", "any"],
+                       help="RTP codec offered first to WebRTC viewers (default: h264)")
 
     args = parser.parse_args()
 
@@ -738,32 +1020,32 @@ if __name__ == "__main__":
     
     # Store preferred codec for use in VideoRecorder
     preferred_codec = args.codec
+    video_codec = {"h264": "video/H264", "vp8": "video/VP8", "any": None}[args.video_codec]
 
     app = web.Application()
     
-    # Setup CORS with more permissive settings
-    cors = cors_setup(app, defaults={
-        "*": ResourceOptions(
-            allow_credentials=True,
-            expose_headers="*",
-            allow_headers="*",
-            allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"]
-        )
-    })
+    # CORS only for the API routes, and only the methods they serve.
+    # CORS_ORIGINS is a comma-separated origin list; unset means any origin.
+    cors_options = ResourceOptions(
+        allow_credentials=True,
+        expose_headers="*",
+        allow_headers="*",
+        allow_methods=["GET", "POST"]
+    )
+    cors_origins = [o.strip() for o in os.environ.get("CORS_ORIGINS", "*").split(",") if o.strip()]
+    cors = cors_setup(app, defaults={origin: cors_options for origin in cors_origins})
     
     # Add routes
     app.router.add_get("/", index)
-    app.router.add_get("/webrtc", webrtc)
-    app.router.add_post("/webrtc", webrtc)
-    app.router.add_get("/diagnostics", get_diagnostics)
-    app.router.add_get("/recording_status", recording_status)
-    app.router.add_post("/recording_status", recording_status)
     app.router.add_get('/mjpeg', mjpeg_stream)
+    for path, handler, methods in (("/webrtc", webrtc, ("GET", "POST")),
+                                   ("/diagnostics", get_diagnostics, ("GET",)),
+                                   ("/recording_status", recording_status, ("GET", "POST"))):
+        resource = cors.add(app.router.add_resource(path))
+        for method in methods:
+            cors.add(resource.add_route(method, handler))
     
-    # Configure CORS for all routes
-    for route in list(app.router.routes()):
-        cors.add(route)
-    
+    app.on_startup.append(on_startup)
     app.on_shutdown.append(on_shutdown)
 
     # Configure SSL if certificates are provided